@@ -27,6 +27,41 @@ class timestamp(float):
         offset = self - timestamp.unix2apple_epoch_delta
         archive.encode('NS.time', offset)
 
+    @classmethod
+    def encode_archives(cls, stamps, archiver: 'Archive') -> list:
+        """
+        Delegate for packing a run of timestamps into NSDate archive objects
+        in one go; returns their uids, the same as archiver.archive would.
+
+        Unlike encode_archive, the class metadata is looked up only once for
+        the whole run, and no ArchivingObject is made per timestamp.
+        """
+        cache = archiver.ref_cache
+        objects = archiver.objects
+        class_uid = None
+        refs = []
+        for stamp in stamps:
+            if cache is not None:
+                ref = cache.get(id(stamp))
+                if ref is not None:
+                    refs.append(ref)
+                    continue
+
+            index = uid(len(objects))
+            archive_obj = {}
+            objects.append(archive_obj)
+            if cache is not None:
+                cache[id(stamp)] = index
+
+            if class_uid is None:
+                class_uid = archiver.uid_for_class(stamp)
+
+            archive_obj['$class'] = class_uid
+            archive_obj['NS.time'] = stamp - cls.unix2apple_epoch_delta
+            refs.append(index)
+
+        return refs
+
     def __str__(self):
         return f"bpylist.timestamp {self.to_datetime().__repr__()}"
 
@@ -78,12 +113,9 @@ class Dict:
         key_uids = archive.decode('NS.keys')
         val_uids = archive.decode('NS.objects')
 
-        count = len(key_uids)
-
-        for i in range(count):
-            key = archive._decode_index(key_uids[i])
-            val = archive._decode_index(val_uids[i])
-            self[key] = val
+        decode = archive._unarchiver.decode_object
+        for key_uid, val_uid in zip(key_uids, val_uids):
+            self[decode(key_uid, archive)] = decode(val_uid, archive)
 
 
 class MutableDict(dict, Dict, Mutable):
@@ -98,8 +130,7 @@ class Array:
 
     def decode_archive(self, archive: 'ArchivedObject'):
         uids = archive.decode('NS.objects')
-        for index in uids:
-            self.append(archive._decode_index(index))
+        self.extend(archive._unarchiver.decode_objects(uids, archive))
 
 
 class MutableArray(list, Array, Mutable):
@@ -114,8 +145,7 @@ class Set:
 
     def decode_archive(self, archive):
         uids = archive.decode('NS.objects')
-        for index in uids:
-            self.add(archive._decode_index(index))
+        self.update(archive._unarchiver.decode_objects(uids, archive))
 
 
 class MutableSet(set, Set, Mutable):
@@ -1,6 +1,7 @@
 from bpylist import bplist
 from bpylist.archive_types import *
-from typing import Mapping, List, Optional, Union, Iterator, IO
+from typing import Mapping, List, Optional, Union, IO, Sequence
+import collections.abc
 import json
 
 # The magic number which Cocoa uses as an implementation version.
@@ -11,6 +12,32 @@ NSKeyedArchiveVersion = 100_000
 # Cached for convenience
 null_uid = uid(0)
 
+# Marks slots of Unarchive.unpacked_uids which have not been decoded yet
+_UNSET = object()
+
+# Delegates of the built-in collections; Unarchive._decode_deep resolves
+# their members before decode_archive runs, so that nesting them does not
+# recurse
+_COLLECTIONS = frozenset((Dict, MutableDict, Array, MutableArray, Set, MutableSet))
+
+# How deep decode_object recurses before it switches to an explicit stack
+_MAX_DEPTH = 100
+
+# Placeholder in Archive.ref_cache while an object's uid is being assigned
+_PENDING = object()
+
+# types which do not require the "object" encoding for an archive
+_PRIMITIVE = frozenset((int, float, bool, str, bytes, uid))
+
+# types which require no extra encoding at all, they can be inlined
+# in the archive
+_INLINE = frozenset((int, float, bool))
+
+# Class chains of the collections Archive encodes itself
+_CLS_ARRAY = ('NSArray', 'NSObject')
+_CLS_DICT = ('NSDictionary', 'NSObject')
+_CLS_SET = ('NSSet', 'NSObject')
+
 
 def loads(plist: bytes, class_map: Union[None, Mapping[str, type], 'ClassMap'] = None, opaque=False) -> object:
     "Unpack an NSKeyedArchived byte blob into a more useful object tree."
@@ -29,9 +56,15 @@ def load(f: IO[bytes], class_map: Union[None, Mapping[str, type], 'ClassMap'] =
     return loads(f.read(), class_map, opaque)
 
 
-def dumps(obj: object, class_map: Union[None, Mapping[str, type], 'ClassMap'] = None, opaque=False) -> bytes:
-    "Pack an object tree into an NSKeyedArchived blob."
-    arch = Archive(obj)
+def dumps(obj: object, class_map: Union[None, Mapping[str, type], 'ClassMap'] = None, opaque=False, assume_tree=False) -> bytes:
+    """
+    Pack an object tree into an NSKeyedArchived blob.
+
+    With assume_tree, objects referenced more than once are archived once
+    per reference instead of being shared, which saves tracking every
+    archived object; cycles are still detected.
+    """
+    arch = Archive(obj, assume_tree)
     if isinstance(class_map, ClassMap):
         arch.class_map = class_map
     elif class_map is not None:
@@ -41,8 +74,8 @@ def dumps(obj: object, class_map: Union[None, Mapping[str, type], 'ClassMap'] =
     return arch.to_bytes()
 
 
-def dump(obj: object, f: IO[bytes], class_map: Union[None, Mapping[str, type], 'ClassMap'] = None, opaque=False):
-    f.write(dumps(obj, class_map, opaque))
+def dump(obj: object, f: IO[bytes], class_map: Union[None, Mapping[str, type], 'ClassMap'] = None, opaque=False, assume_tree=False):
+    f.write(dumps(obj, class_map, opaque, assume_tree))
 
 
 class ArchiverError(Exception):
@@ -121,23 +154,60 @@ class ArchivedObject:
     This is the object that will be passed to unarchiving delegates
     so that they can construct objects. The only useful method on
     this class is decode(self, key).
+
+    Unarchive reuses an instance for every object decoded at the same
+    depth, so delegates must not hold on to it after decode_archive returns.
+
+    Delegates which decode many uids at once (e.g. collections) may call
+    the Unarchive in _unarchiver directly, passing the wrapper along;
+    see Unarchive.decode_objects.
     """
 
-    def __init__(self, uid, obj, unarchiver):
+    def __init__(self, uid, obj, unarchiver, depth=0):
         self._uid = uid
         self._object = obj
         self._unarchiver = unarchiver
+        self._depth = depth
+        # the wrapper for the objects which this object's delegate decodes
+        self._child = None
 
     def _decode_index(self, index: uid):
-        return self._unarchiver.decode_object(index)
+        return self._unarchiver.decode_object(index, self)
 
     def decode(self, key: str):
-        return self._unarchiver.decode_key(self._object, key)
+        return self._unarchiver.decode_key(self._object, key, self)
 
     def keys(self):
         return (k for k in self._object.keys() if k != '$class')
 
 
+class LazyArchivedDict(collections.abc.Mapping):
+    """
+    Read-only view of an archived dictionary (or object) which decodes
+    each value only when it is looked up.
+
+    Keys are decoded up front; values are decoded through the Unarchive
+    that made the view, which also caches them.
+    """
+
+    def __init__(self, unarchiver: 'Unarchive', raw: dict):
+        self._unarchiver = unarchiver
+        # keys mapped to the archived value: a uid, or an inlined primitive
+        self._raw = raw
+
+    def __getitem__(self, key):
+        val = self._raw[key]
+        if type(val) is uid:
+            return self._unarchiver.decode_object(val)
+        return val
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+
 class Unarchive:
     """
     Capable of unpacking an archived object tree in the NSKeyedArchive format.
@@ -160,36 +230,73 @@ class Unarchive:
     def __init__(self, input: bytes):
         self.input = input
         self.class_map = DefaultClassMap()
-        self.unpacked_uids = {}
+        self.unpacked_uids = None
         self.top_uid = null_uid
         self.objects = None
-
-    def unpack_archive_header(self):
-        plist = bplist.loads(self.input)
-
-        archiver = plist.get('$archiver')
+        # cache/map class uids to the already validated delegate class
+        self._class_by_uid = {}
+
+    def unpack_archive_header(self, lazy=False):
+        # only the top-level dict is looked at here; a full decode touches
+        # every object anyway, so $objects is parsed in one go, while a lazy
+        # one keeps it as a reader view, so that only objects reachable from
+        # the root are ever parsed
+        reader = bplist.open(self.input)
+        plist = reader.dict(reader.top) or {}
+
+        def header_value(key):
+            index = plist.get(key)
+            return None if index is None else reader[index]
+
+        def header():
+            # the top-level dict as bplist.loads would give it, for errors
+            return {key: reader[index] for key, index in plist.items()}
+
+        archiver = header_value('$archiver')
         if archiver != 'NSKeyedArchiver':
             raise UnsupportedArchiver(archiver)
 
-        version = plist.get('$version')
+        version = header_value('$version')
         if version != NSKeyedArchiveVersion:
             raise UnsupportedArchiveVersion(version)
 
-        top = plist.get('$top')
+        top = header_value('$top')
         if not isinstance(top, dict):
-            raise MissingTopObject(plist)
+            raise MissingTopObject(header())
 
         self.top_uid = top.get('root')
         if not isinstance(self.top_uid, uid):
             raise MissingTopObjectUID(top)
 
-        self.objects = plist.get('$objects')
-        if not isinstance(self.objects, list):
-            raise MissingObjectsArray(plist)
+        if lazy:
+            objects_index = plist.get('$objects')
+            objects = None if objects_index is None else reader.array(objects_index)
+        else:
+            objects = header_value('$objects')
+            if not isinstance(objects, list):
+                objects = None
+        if objects is None:
+            raise MissingObjectsArray(header())
+        self.objects = objects
+
+        # uids are dense indexes into $objects, so a flat list makes
+        # for a cheaper cache than a dict keyed by uid; like the class
+        # cache, it outlives a second unpack of the same input
+        if self.unpacked_uids is None:
+            self.unpacked_uids = [_UNSET] * len(objects)
+
+            # index 0 always points to the $null object, which is the archive's
+            # special way of saying the value is null/nil/none
+            if self.unpacked_uids:
+                self.unpacked_uids[0] = None
 
     def class_for_uid(self, index: uid):
         "use the UNARCHIVE_CLASS_MAP to find the unarchiving delegate of a uid"
 
+        klass = self._class_by_uid.get(index)
+        if klass is not None:
+            return klass
+
         meta = self.objects[index]
         if not isinstance(meta, dict):
             raise MissingClassMetaData(index, meta)
@@ -209,35 +316,47 @@ class Unarchive:
         if klass is None:
             raise MissingClassMapping(name, self.class_map)
 
+        self._class_by_uid[index] = klass
         return klass
 
-    def decode_key(self, obj, key):
+    def decode_key(self, obj, key, parent: Optional[ArchivedObject] = None):
         val = obj.get(key)
-        if isinstance(val, uid):
-            return self.decode_object(val)
+        if type(val) is uid:
+            return self.decode_object(val, parent)
         return val
 
-    def decode_object(self, index: uid):
-        # index 0 always points to the $null object, which is the archive's
-        # special way of saying the value is null/nil/none
-        if index == 0:
-            return None
-
-        obj = self.unpacked_uids.get(index)
-        if obj is CycleToken:
-            raise CircularReference(index)
-
-        if obj is not None:
+    def decode_object(self, index: uid, parent: Optional[ArchivedObject] = None):
+        cache = self.unpacked_uids
+        obj = cache[index]
+        if obj is not _UNSET:
+            if obj is CycleToken:
+                raise CircularReference(index)
             return obj
 
         raw_obj = self.objects[index]
 
         # if obj is a (semi-)primitive type (e.g. str)
-        if not isinstance(raw_obj, dict):
+        if type(raw_obj) is not dict:
+            cache[index] = raw_obj
             return raw_obj
 
+        # the objects decoded on behalf of one parent take turns with a
+        # single wrapper, instead of getting one each
+        if parent is None:
+            archived = ArchivedObject(index, raw_obj, self)
+        else:
+            archived = parent._child
+            if archived is None:
+                depth = parent._depth + 1
+                if depth > _MAX_DEPTH:
+                    return self._decode_deep(index, depth)
+                archived = parent._child = ArchivedObject(index, raw_obj, self, depth)
+            else:
+                archived._uid = index
+                archived._object = raw_obj
+
         class_uid = raw_obj.get('$class')
-        if not isinstance(class_uid, uid):
+        if type(class_uid) is not uid:
             raise MissingClassUID(raw_obj)
 
         klass = self.class_for_uid(class_uid)
@@ -245,24 +364,124 @@ class Unarchive:
         # put a temp object in place, in case we have a circular reference
         # classes that don't support two-phase initialization should return CycleToken
         obj = klass.__new__(klass)
-        self.unpacked_uids[index] = obj
+        cache[index] = obj
 
-        new_obj = klass.decode_archive(obj, ArchivedObject(uid, raw_obj, self))
+        new_obj = klass.decode_archive(obj, archived)
         if obj is CycleToken:
-            self.unpacked_uids[index] = new_obj
+            cache[index] = new_obj
             return new_obj
-        else:
-            if new_obj is not None:
-                print(klass)
-            assert new_obj is None
-            return obj
+
+        assert new_obj is None, f"{klass}.decode_archive returned a value"
+        return obj
+
+    def _decode_deep(self, index: uid, depth: int):
+        """
+        decode_object for objects nested too deeply to keep recursing
+
+        This walks the object graph with an explicit stack instead: every
+        object leaves an (index, klass, raw_obj) marker on the stack, which
+        runs decode_archive when it is popped. The members of built-in
+        collections are pushed above the marker, so they are all in the
+        cache by then; other delegates decode what they need on demand.
+        """
+
+        cache = self.unpacked_uids
+        objects = self.objects
+        archived = ArchivedObject(index, None, self, depth)
+
+        stack = [index]
+        while stack:
+            item = stack.pop()
+
+            if type(item) is tuple:
+                item, klass, raw_obj = item
+                obj = cache[item]
+                archived._uid = item
+                archived._object = raw_obj
+                new_obj = klass.decode_archive(obj, archived)
+                if obj is CycleToken:
+                    cache[item] = new_obj
+                else:
+                    assert new_obj is None, f"{klass}.decode_archive returned a value"
+                continue
+
+            if cache[item] is not _UNSET:
+                continue
+
+            raw_obj = objects[item]
+            if type(raw_obj) is not dict:
+                cache[item] = raw_obj
+                continue
+
+            class_uid = raw_obj.get('$class')
+            if type(class_uid) is not uid:
+                raise MissingClassUID(raw_obj)
+
+            klass = self.class_for_uid(class_uid)
+            cache[item] = klass.__new__(klass)
+            stack.append((item, klass, raw_obj))
+
+            if klass in _COLLECTIONS:
+                stack.extend(raw_obj.get('NS.objects', ()))
+                stack.extend(raw_obj.get('NS.keys', ()))
+
+        return cache[index]
+
+    def decode_objects(self, indexes: List[uid],
+                       parent: Optional[ArchivedObject] = None) -> list:
+        "decode a batch of uids, e.g. all the members of a collection"
+
+        # big runs of primitives (e.g. an array of numbers) are common enough
+        # to try in bulk: their raw values are the decoded ones, and all the
+        # checks run in C; plist values are builtin types, so `in` cannot end
+        # up in user code
+        if len(indexes) > 16:
+            raw_objs = list(map(self.objects.__getitem__, indexes))
+            if dict not in map(type, raw_objs) and null_uid not in indexes:
+                return raw_objs
+
+        # a plain loop, since most collections are too short for a
+        # comprehension to pay for its setup
+        decode = self.decode_object
+        objs = []
+        for index in indexes:
+            objs.append(decode(index, parent))
+        return objs
 
     def top_object(self):
-        "recursively decode the root/top object and return the result"
+        "decode the root/top object and everything it references"
 
         self.unpack_archive_header()
         return self.decode_object(self.top_uid)
 
+    def top_object_lazy(self):
+        """
+        like top_object, but if the root is a dictionary or an opaque object,
+        only decode its keys and return a LazyArchivedDict for it; other
+        roots are decoded in full
+        """
+
+        self.unpack_archive_header(lazy=True)
+
+        raw_obj = self.objects[self.top_uid]
+        if type(raw_obj) is not dict:
+            return self.decode_object(self.top_uid)
+
+        class_uid = raw_obj.get('$class')
+        if type(class_uid) is not uid:
+            raise MissingClassUID(raw_obj)
+
+        klass = self.class_for_uid(class_uid)
+        if issubclass(klass, Dict):
+            keys = self.decode_objects(raw_obj.get('NS.keys', []))
+            raw = dict(zip(keys, raw_obj.get('NS.objects', [])))
+        elif issubclass(klass, OpaqueObject):
+            raw = {k: v for k, v in raw_obj.items() if k != '$class'}
+        else:
+            return self.decode_object(self.top_uid)
+
+        return LazyArchivedDict(self, raw)
+
 
 class ArchivingObject:
     """
@@ -294,24 +513,28 @@ class Archive:
     references...so, yeah.
     """
 
-    # types which do not require the "object" encoding for an archive;
-    primitive_types = [int, float, bool, str, bytes, uid]
-
-    # types which require no extra encoding at all, they can be inlined
-    # in the archive
-    inline_types = [int, float, bool]
-
-    def __init__(self, input):
+    def __init__(self, input, assume_tree=False):
         self.input = input
         self.class_map = DefaultClassMap()
         # cache/map class names (str) to uids
         self.class_cache = {}
-        # cache/map of already archived objects to uids (to avoid cycles)
-        self.ref_cache = {}
+        # cache/map of already archived objects to uids (to avoid cycles);
+        # when the object graph is known to be a tree there is no sharing
+        # to preserve, so only the objects currently being encoded are
+        # tracked, which is enough to catch a cycle
+        if assume_tree:
+            self.ref_cache = None
+            self._path = {}
+        else:
+            self.ref_cache = {}
         # objects that go directly into the archive, always start with $null
         self.objects = ['$null']
+        # the generated archive, once to_bytes has been called
+        self._cached_bytes = None
+        # cache/map python classes to the uid of their class chain
+        self._class_uids = {}
 
-    def uid_for_class_chain(self, class_chain: List[str]) -> uid:
+    def uid_for_class_chain(self, class_chain: Sequence[str]) -> uid:
         """
         Ensure the class definition for the archiver is included in the arcive.
 
@@ -330,65 +553,81 @@ class Archive:
 
         val = uid(len(self.objects))
         self.class_cache[class_chain[0]] = val
-        self.objects.append({ '$classes': class_chain, '$classname': class_chain[0] })
+        self.objects.append({ '$classes': list(class_chain), '$classname': class_chain[0] })
 
         return val
 
     def encode(self, val):
-        cls = val.__class__
-
-        if cls in Archive.inline_types:
+        if type(val) in _INLINE:
             return val
 
         return self.archive(val)
 
+    def uid_for_class(self, obj) -> uid:
+        "Like uid_for_class_chain, for the class chain the class map has for obj"
+
+        cls = type(obj)
+        val = self._class_uids.get(cls)
+        if val is not None:
+            return val
+
+        archiver = self.class_map.get_objc_class(cls)
+        if archiver is None:
+            raise MissingClassMapping(obj, self.class_map)
+
+        val = self._class_uids[cls] = self.uid_for_class_chain(archiver)
+        return val
+
     def encode_list(self, objs, archive_obj):
-        archiver_uid = self.uid_for_class_chain(['NSArray', 'NSObject'])
+        archiver_uid = self.uid_for_class_chain(_CLS_ARRAY)
         archive_obj['$class'] = archiver_uid
-        archive_obj['NS.objects'] = [self.archive(obj) for obj in objs]
+        # runs of timestamps (e.g. logs) are common enough to batch
+        if objs and type(objs[0]) is timestamp and all(type(obj) is timestamp for obj in objs):
+            refs = timestamp.encode_archives(objs, self)
+        else:
+            refs = [self.archive(obj) for obj in objs]
+        archive_obj['NS.objects'] = refs
 
     def encode_set(self, objs, archive_obj):
-        archiver_uid = self.uid_for_class_chain(['NSSet', 'NSObject'])
+        archiver_uid = self.uid_for_class_chain(_CLS_SET)
         archive_obj['$class'] = archiver_uid
         archive_obj['NS.objects'] = [self.archive(obj) for obj in objs]
 
     def encode_dict(self, obj, archive_obj):
-        archiver_uid = self.uid_for_class_chain(['NSDictionary', 'NSObject'])
+        archiver_uid = self.uid_for_class_chain(_CLS_DICT)
         archive_obj['$class'] = archiver_uid
 
         keys = []
         vals = []
-        for k in obj:
+        for k, v in obj.items():
             keys.append(self.archive(k))
-            vals.append(self.archive(obj[k]))
+            vals.append(self.archive(v))
 
         archive_obj['NS.keys'] = keys
         archive_obj['NS.objects'] = vals
 
-    def encode_top_level(self, obj, archive_obj):
-        "Encode obj and store the encoding in archive_obj"
+    # encoders for the built-in collections, by exact type; every subclass
+    # gets its own table, so that overrides of them still apply
+    _encoders = {list: encode_list, dict: encode_dict, set: encode_set}
 
-        cls = obj.__class__
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._encoders = {list: cls.encode_list, dict: cls.encode_dict, set: cls.encode_set}
 
-        if cls == list:
-            self.encode_list(obj, archive_obj)
-
-        elif cls == dict:
-            self.encode_dict(obj, archive_obj)
+    def encode_top_level(self, obj, archive_obj):
+        "Encode obj and store the encoding in archive_obj"
 
-        elif cls == set:
-            self.encode_set(obj, archive_obj)
+        cls = type(obj)
 
-        else:
-            archiver = self.class_map.get_objc_class(cls)
-            if archiver is None:
-                raise MissingClassMapping(obj, self.class_map)
+        encoder = self._encoders.get(cls)
+        if encoder is not None:
+            encoder(self, obj, archive_obj)
+            return
 
-            archiver_uid = self.uid_for_class_chain(archiver)
-            archive_obj['$class'] = archiver_uid
+        archive_obj['$class'] = self.uid_for_class(obj)
 
-            archive_wrapper = ArchivingObject(archive_obj, self)
-            cls.encode_archive(obj, archive_wrapper)
+        archive_wrapper = ArchivingObject(archive_obj, self)
+        cls.encode_archive(obj, archive_wrapper)
 
     def archive(self, obj) -> uid:
         "Add the encoded form of obj to the archive, returning the UID of obj."
@@ -396,23 +635,51 @@ class Archive:
         if obj is None:
             return null_uid
 
+        cache = self.ref_cache
+        if cache is None:
+            return self._archive_tree(obj)
+
         # the ref_map allows us to avoid infinite recursion caused by
         # cycles in the object graph by functioning as a sort of promise
-        ref = self.ref_cache.get(id(obj))
-        if ref:
+        oid = id(obj)
+        ref = cache.setdefault(oid, _PENDING)
+        if ref is not _PENDING:
             return ref
 
+        cls = type(obj)
+        index = uid(len(self.objects))
+        cache[oid] = index
+
+        if cls in _PRIMITIVE:
+            self.objects.append(obj)
+            return index
+
+        archive_obj = {}
+        self.objects.append(archive_obj)
+        self.encode_top_level(obj, archive_obj)
+
+        return index
+
+    def _archive_tree(self, obj) -> uid:
+        "archive() for graphs without sharing; every object gets its own uid"
+
         index = uid(len(self.objects))
-        self.ref_cache[id(obj)] = index
 
-        cls = obj.__class__
-        if cls in Archive.primitive_types:
+        if type(obj) in _PRIMITIVE:
             self.objects.append(obj)
             return index
 
+        oid = id(obj)
+        path = self._path
+        ref = path.get(oid)
+        if ref is not None:
+            raise CircularReference(ref)
+
         archive_obj = {}
         self.objects.append(archive_obj)
+        path[oid] = index
         self.encode_top_level(obj, archive_obj)
+        del path[oid]
 
         return index
 
@@ -420,6 +687,9 @@ class Archive:
         "Generate the archive and return it as a bytes blob"
 
         # avoid regenerating
+        if self._cached_bytes is not None:
+            return self._cached_bytes
+
         if len(self.objects) == 1:
             self.archive(self.input)
 
@@ -429,7 +699,8 @@ class Archive:
               '$top': { 'root': uid(1) }
         }
 
-        return bplist.dumps(d)
+        self._cached_bytes = bplist.dumps(d)
+        return self._cached_bytes
 
 
 class ClassMap(object):
@@ -484,32 +755,51 @@ class DefaultClassMap(ClassMap):
 
 
 class OpaqueClassMap(ClassMap):
+    # marks classes which are not in _chain_cache yet
+    _NOT_CACHED = object()
+
     def __init__(self, base: ClassMap):
         self.base = base
+        # cache/map full class chains (tuples) to the generated class
         self.class_cache = {}
+        # cache/map (base class, objc class name) to the generated class,
+        # so that chains which share their root share the base classes too
+        self._base_cache = {}
+        # cache/map python classes to their objc class chain, or to None
+        # for classes which are not opaque and are left to the base map
+        self._chain_cache = {}
 
     def get_python_class(self, class_chain):
         k = self.base.get_python_class(class_chain)
         if k is not None:
             return k
-        return self._make_class(iter(class_chain))
+        return self._make_class(class_chain)
 
     def get_objc_class(self, cls):
-        if issubclass(cls, OpaqueObject):
-            return self._get_class_chain(cls)
-        return self.base.get_objc_class(cls)
-
-    def _make_class(self, class_chain_iter: Iterator[str]) -> type:
-        try:
-            objc_class = next(class_chain_iter)
-        except StopIteration:
-            return OpaqueObject
-        klass = self.class_cache.get(objc_class)
+        chain = self._chain_cache.get(cls, self._NOT_CACHED)
+        if chain is self._NOT_CACHED:
+            chain = self._get_class_chain(cls) if issubclass(cls, OpaqueObject) else None
+            self._chain_cache[cls] = chain
+        if chain is None:
+            return self.base.get_objc_class(cls)
+        return list(chain)
+
+    def _make_class(self, class_chain: Sequence[str]) -> type:
+        key = tuple(class_chain)
+        klass = self.class_cache.get(key)
         if klass is not None:
             return klass
-        base = self._make_class(class_chain_iter)
-        klass = type(objc_class, (base, ), {})
-        self.class_cache[objc_class] = klass
+
+        # build the hierarchy from the root down, every class at most once
+        klass = OpaqueObject
+        for objc_class in reversed(key):
+            base = klass
+            klass = self._base_cache.get((base, objc_class))
+            if klass is None:
+                klass = type(objc_class, (base, ), {})
+                self._base_cache[(base, objc_class)] = klass
+
+        self.class_cache[key] = klass
         return klass
 
     def _get_class_chain(self, cls: type) -> List[str]:
@@ -1,5 +1,6 @@
 #include <Python.h>
 #include <pytime.h>
+#include <structmember.h>
 #include <stdint.h>
 
 #define likely(x) __builtin_expect(!!(x), 1)
@@ -483,8 +484,11 @@ resize_plist_if_needed(bplist_generate_state* const state,
         /* follow simple exponential growth curve for buffers;
          * is it the best choice? I don't know...measure it!
          */
-        const size_t new_length =
-            (state->objects_end - state->objects) * 2;
+        const size_t used_space = state->current_object - state->objects;
+
+        size_t new_length = (state->objects_end - state->objects) * 2;
+        while (new_length - used_space < required_space)
+            new_length *= 2;
 
         return resize_plist_buffer(state, new_length);
     }
@@ -875,13 +879,14 @@ generate_dict(bplist_generate_state* const state, PyObject* const py_obj)
 
 /* this is where the magic starts for plist parsing */
 
-static PyObject*
-parse_plist_object(const bplist_parse_state* const state,
-                   const size_t object_index)
+/**
+ * Look up where the object at object_index starts in the data blob;
+ * returns NULL with an exception set if the index or offset is bogus.
+ */
+static const uint8_t*
+find_plist_object(const bplist_parse_state* const state,
+                  const size_t object_index)
 {
-    // TODO: check if object_index has already been unpacked, return
-    //       that object pointer instead, to avoid circular refs
-
     /* offsets in the offset_table tell you where an object/value
      * starts in the data blob
      */
@@ -896,7 +901,7 @@ parse_plist_object(const bplist_parse_state* const state,
         return NULL;
     }
 
-    const uint8_t* object =
+    const uint8_t* const object =
         state->data + unpack_uint(state->offset_size, object_ref);
 
     if (unlikely(object <= state->data || object >= state->data_end)) {
@@ -907,6 +912,21 @@ parse_plist_object(const bplist_parse_state* const state,
         return NULL;
     }
 
+    return object;
+}
+
+static PyObject*
+parse_plist_object(const bplist_parse_state* const state,
+                   const size_t object_index)
+{
+    // TODO: check if object_index has already been unpacked, return
+    //       that object pointer instead, to avoid circular refs
+
+    const uint8_t* object = find_plist_object(state, object_index);
+
+    if (unlikely(object == NULL))
+        return NULL;
+
     const uint8_t object_type = *object++;
 
     switch (object_type & 0xF0)
@@ -981,40 +1001,38 @@ check_int_width(const size_t width, const char* const name)
     return 0;
 }
 
-static PyObject*
-load_plist_from_bytes(PyObject* const self, PyObject* const plist_data)
+/**
+ * Validate the header and trailer of a binary plist blob and fill in the
+ * parse state needed to decode objects out of it.
+ *
+ * Returns 0 on success, -1 with an exception set on failure.
+ */
+static int
+init_parse_state(const uint8_t* const data,
+                 const size_t data_len,
+                 bplist_parse_state* const state,
+                 uint64_t* const top_object_index)
 {
-    char* signed_data;
-    ssize_t signed_data_len;
-
-    const int correct_type =
-        PyBytes_AsStringAndSize(plist_data, &signed_data, &signed_data_len);
-
-    if (unlikely(correct_type == -1))
-        return NULL;
-
-    if (unlikely(strncmp(signed_data,
+    if (unlikely(data_len < bplist_header_length ||
+                 strncmp((const char*)data,
                          bplist_header,
                          bplist_header_length) != 0))
     {
         PyErr_SetString(PyExc_RuntimeError, "invalid header for bplist");
-        return NULL;
+        return -1;
     }
 
-    const size_t data_len = (size_t)signed_data_len;
-
     if (unlikely(data_len < (bplist_header_length + sizeof(bplist_trailer)))) {
         PyErr_SetString(PyExc_RuntimeError, "bplist is too short to be valid");
-        return NULL;
+        return -1;
     }
 
-    const uint8_t* const data = (const uint8_t*)signed_data;
     const uint8_t* const data_end = data + data_len;
 
     const bplist_trailer* const trailer =
         (bplist_trailer*)(data_end - sizeof(bplist_trailer));
 
-    const bplist_parse_state state = {
+    *state = (bplist_parse_state) {
         .data = data,
         .data_end = (const uint8_t*)trailer, /* minor lie */
         .ref_size = (size_t)trailer->ref_size,
@@ -1023,22 +1041,48 @@ load_plist_from_bytes(PyObject* const self, PyObject* const plist_data)
         .offset_table = data + SwapBigToHost64(trailer->offset_table_offset)
     };
 
-    if (unlikely(check_int_width(state.offset_size, "offset_size") == -1 ||
-                 check_int_width(state.ref_size, "ref_size") == -1))
+    if (unlikely(check_int_width(state->offset_size, "offset_size") == -1 ||
+                 check_int_width(state->ref_size, "ref_size") == -1))
     {
-        return NULL;
+        return -1;
     }
 
-    if (unlikely(state.offset_table > state.data_end)) {
+    if (unlikely(state->offset_table > state->data_end)) {
         PyErr_SetString(PyExc_RuntimeError,
                         "bplist offset_table is out of bounds of input bytes");
-        return NULL;
+        return -1;
     }
 
     /* top_object_index is an index into the offset_table
      * for the top-level object in the plist
      */
-    const uint64_t top_object_index = SwapBigToHost64(trailer->top_object);
+    *top_object_index = SwapBigToHost64(trailer->top_object);
+
+    return 0;
+}
+
+static PyObject*
+load_plist_from_bytes(PyObject* const self, PyObject* const plist_data)
+{
+    char* signed_data;
+    ssize_t signed_data_len;
+
+    const int correct_type =
+        PyBytes_AsStringAndSize(plist_data, &signed_data, &signed_data_len);
+
+    if (unlikely(correct_type == -1))
+        return NULL;
+
+    bplist_parse_state state;
+    uint64_t top_object_index;
+
+    if (unlikely(init_parse_state((const uint8_t*)signed_data,
+                                  (size_t)signed_data_len,
+                                  &state,
+                                  &top_object_index) == -1))
+    {
+        return NULL;
+    }
 
     return parse_plist_object(&state, top_object_index);
 }
@@ -1059,6 +1103,311 @@ load_plist_from_file(PyObject* const self, PyObject* const plist_file)
     return res;
 }
 
+/* lazy plist reading starts here */
+
+/**
+ * A Reader decodes objects out of a binary plist one at a time, on demand,
+ * instead of materializing the whole object tree up front.
+ *
+ * A root Reader (made by bplist.open) is indexed by offset table index.
+ * Reader.array() makes a view which is anchored at an array object and
+ * is indexed by position in that array; views share the buffer of the
+ * root Reader and keep it alive.
+ */
+typedef struct _bplist_reader {
+    PyObject_HEAD
+    /* the root Reader for views, NULL for the root Reader itself */
+    PyObject* owner;
+    /* only valid for the root Reader */
+    Py_buffer buffer;
+    bplist_parse_state state;
+    /* object references of the anchoring array, NULL for the root Reader */
+    const uint8_t* refs;
+    Py_ssize_t length;
+    Py_ssize_t top;
+} bplist_reader;
+
+static PyTypeObject bplist_reader_type;
+
+/**
+ * Map an index in the reader's own index space into an offset table index;
+ * returns -1 with an IndexError set if the index is out of range.
+ */
+static Py_ssize_t
+reader_resolve(const bplist_reader* const reader, const Py_ssize_t index)
+{
+    if (unlikely(index < 0 || index >= reader->length)) {
+        PyErr_SetString(PyExc_IndexError, "bplist reader index out of range");
+        return -1;
+    }
+
+    if (reader->refs == NULL)
+        return index;
+
+    const size_t ref_size = reader->state.ref_size;
+    return (Py_ssize_t)unpack_uint(ref_size, reader->refs + (index * ref_size));
+}
+
+static Py_ssize_t
+reader_length(PyObject* const self)
+{
+    return ((bplist_reader*)self)->length;
+}
+
+static PyObject*
+reader_item(PyObject* const self, const Py_ssize_t index)
+{
+    const bplist_reader* const reader = (bplist_reader*)self;
+
+    const Py_ssize_t object_index = reader_resolve(reader, index);
+    if (unlikely(object_index == -1))
+        return NULL;
+
+    return parse_plist_object(&reader->state, (size_t)object_index);
+}
+
+static PyObject*
+reader_dict(PyObject* const self, PyObject* const py_index)
+{
+    const bplist_reader* const reader = (bplist_reader*)self;
+
+    const Py_ssize_t index = PyNumber_AsSsize_t(py_index, PyExc_IndexError);
+    if (unlikely(index == -1 && PyErr_Occurred()))
+        return NULL;
+
+    const Py_ssize_t object_index = reader_resolve(reader, index);
+    if (unlikely(object_index == -1))
+        return NULL;
+
+    const bplist_parse_state* const state = &reader->state;
+
+    const uint8_t* object = find_plist_object(state, (size_t)object_index);
+    if (unlikely(object == NULL))
+        return NULL;
+
+    const uint8_t type = *object++;
+    if ((type & 0xF0) != plist_type_dict)
+        Py_RETURN_NONE;
+
+    const size_t length = (size_t)unpack_length(type, &object);
+    const size_t ref_size = state->ref_size;
+
+    if (unlikely((object + (length * ref_size * 2)) > state->data_end)) {
+        PyErr_Format(PyExc_RuntimeError,
+                     "bplist parsing hit an invalid dict length: %zd",
+                     length);
+        return NULL;
+    }
+
+    PyObject* const dict = PyDict_New();
+    if (unlikely(dict == NULL))
+        return NULL;
+
+    const uint8_t* key_object = object;
+    const uint8_t* val_object = object + (length * ref_size);
+
+    size_t i = 0;
+    for (; i < length; i++) {
+
+        const size_t key_obj_index = unpack_uint(ref_size, key_object);
+        const size_t val_obj_index = unpack_uint(ref_size, val_object);
+
+        key_object += ref_size;
+        val_object += ref_size;
+
+        PyObject* const key_obj = parse_plist_object(state, key_obj_index);
+        PyObject* const val_obj = PyLong_FromSize_t(val_obj_index);
+
+        if (unlikely(key_obj == NULL || val_obj == NULL)) {
+            Py_XDECREF(key_obj);
+            Py_XDECREF(val_obj);
+            Py_DECREF(dict);
+            return NULL;
+        }
+
+        const int did_set_item = PyDict_SetItem(dict, key_obj, val_obj);
+
+        Py_DECREF(key_obj);
+        Py_DECREF(val_obj);
+
+        if (unlikely(did_set_item == -1)) {
+            Py_DECREF(dict);
+            return NULL;
+        }
+    }
+
+    return dict;
+}
+
+static PyObject*
+reader_array(PyObject* const self, PyObject* const py_index)
+{
+    bplist_reader* const reader = (bplist_reader*)self;
+
+    const Py_ssize_t index = PyNumber_AsSsize_t(py_index, PyExc_IndexError);
+    if (unlikely(index == -1 && PyErr_Occurred()))
+        return NULL;
+
+    const Py_ssize_t object_index = reader_resolve(reader, index);
+    if (unlikely(object_index == -1))
+        return NULL;
+
+    const bplist_parse_state* const state = &reader->state;
+
+    const uint8_t* object = find_plist_object(state, (size_t)object_index);
+    if (unlikely(object == NULL))
+        return NULL;
+
+    const uint8_t type = *object++;
+    if ((type & 0xF0) != plist_type_array)
+        Py_RETURN_NONE;
+
+    const ssize_t length = unpack_length(type, &object);
+
+    if (unlikely((object + (length * state->ref_size)) > state->data_end)) {
+        PyErr_Format(PyExc_RuntimeError,
+                     "bplist parsing hit an invalid array length: %zd",
+                     length);
+        return NULL;
+    }
+
+    bplist_reader* const view =
+        PyObject_New(bplist_reader, &bplist_reader_type);
+
+    if (unlikely(view == NULL))
+        return NULL;
+
+    PyObject* const owner = reader->owner ? reader->owner : self;
+    Py_INCREF(owner);
+
+    view->owner = owner;
+    view->state = reader->state;
+    view->refs = object;
+    view->length = length;
+    view->top = reader->top;
+
+    return (PyObject*)view;
+}
+
+static void
+reader_dealloc(PyObject* const self)
+{
+    bplist_reader* const reader = (bplist_reader*)self;
+
+    if (reader->owner == NULL)
+        PyBuffer_Release(&reader->buffer);
+    else
+        Py_DECREF(reader->owner);
+
+    PyObject_Del(self);
+}
+
+static PyObject*
+open_plist_reader(PyObject* const self, PyObject* const plist_data)
+{
+    bplist_reader* const reader =
+        PyObject_New(bplist_reader, &bplist_reader_type);
+
+    if (unlikely(reader == NULL))
+        return NULL;
+
+    reader->owner = NULL;
+
+    if (unlikely(PyObject_GetBuffer(plist_data,
+                                    &reader->buffer,
+                                    PyBUF_CONTIG_RO) == -1))
+    {
+        /* nothing to release yet, so skip reader_dealloc */
+        PyObject_Del(reader);
+        return NULL;
+    }
+
+    uint64_t top_object_index;
+
+    if (unlikely(init_parse_state((const uint8_t*)reader->buffer.buf,
+                                  (size_t)reader->buffer.len,
+                                  &reader->state,
+                                  &top_object_index) == -1))
+    {
+        Py_DECREF(reader);
+        return NULL;
+    }
+
+    reader->refs = NULL;
+    reader->length = (Py_ssize_t)reader->state.object_count;
+    reader->top = (Py_ssize_t)top_object_index;
+
+    return (PyObject*)reader;
+}
+
+PyDoc_STRVAR(reader_dict__docstring__,
+             "dict(index: int) -> Optional[Dict[object, int]]\n\n" \
+             "decode the keys of the dict at index, mapping each key to the " \
+             "offset table index of its value; None if it is not a dict");
+
+PyDoc_STRVAR(reader_array__docstring__,
+             "array(index: int) -> Optional[Reader]\n\n" \
+             "make a Reader over the elements of the array at index; " \
+             "None if it is not an array");
+
+static PyMethodDef reader_methods[] = {
+    {
+        "dict",
+        reader_dict,
+        METH_O,
+        reader_dict__docstring__
+    },
+    {
+        "array",
+        reader_array,
+        METH_O,
+        reader_array__docstring__
+    },
+    { /* sentinel */
+        NULL,
+        NULL,
+        0,
+        NULL
+    }
+};
+
+static PyMemberDef reader_members[] = {
+    {
+        "top",
+        T_PYSSIZET,
+        offsetof(bplist_reader, top),
+        READONLY,
+        "offset table index of the top-level object"
+    },
+    { /* sentinel */
+        NULL,
+        0,
+        0,
+        0,
+        NULL
+    }
+};
+
+static PySequenceMethods reader_as_sequence = {
+    .sq_length = reader_length,
+    .sq_item = reader_item,
+};
+
+PyDoc_STRVAR(reader__docstring__,
+             "Lazy binary plist reader; each item is decoded on access");
+
+static PyTypeObject bplist_reader_type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "bpylist.bplist.Reader",
+    .tp_basicsize = sizeof(bplist_reader),
+    .tp_dealloc = reader_dealloc,
+    .tp_as_sequence = &reader_as_sequence,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_doc = reader__docstring__,
+    .tp_methods = reader_methods,
+    .tp_members = reader_members,
+};
+
 static int
 generate_plist_object(bplist_generate_state* const state,
                       PyObject* const py_obj)
@@ -1299,6 +1648,10 @@ PyDoc_STRVAR(load__docstring__,
              "load(f: IO[bytes]) -> object\n\n" \
              "load a python object from a file containing binary plist data");
 
+PyDoc_STRVAR(open__docstring__,
+             "open(s: bytes) -> Reader\n\n" \
+             "make a lazy reader for binary plist data, without parsing it");
+
 PyDoc_STRVAR(dumps__docstring__,
              "dumps(obj: object) -> bytes\n\n" \
              "dump python object into a binary plist data blob");
@@ -1320,6 +1673,12 @@ static PyMethodDef plist_methods[] = {
         METH_O,
         load__docstring__
     },
+    {
+        "open",
+        open_plist_reader,
+        METH_O,
+        open__docstring__
+    },
     {
         "dumps",
         dump_plist_to_bytes,
@@ -1409,5 +1768,26 @@ PyInit_bplist(void)
         return NULL;
     }
 
-    return PyModule_Create(&plist_module);
+    if (unlikely(PyType_Ready(&bplist_reader_type) == -1)) {
+        Py_CLEAR(utf16_encoder);
+        Py_CLEAR(ts_class);
+        Py_CLEAR(uid_class);
+        return NULL;
+    }
+
+    PyObject* const module = PyModule_Create(&plist_module);
+    if (unlikely(module == NULL))
+        return NULL;
+
+    Py_INCREF(&bplist_reader_type);
+    if (unlikely(PyModule_AddObject(module,
+                                    "Reader",
+                                    (PyObject*)&bplist_reader_type) == -1))
+    {
+        Py_DECREF(&bplist_reader_type);
+        Py_DECREF(module);
+        return NULL;
+    }
+
+    return module;
 }
@@ -1,6 +1,8 @@
 from unittest import TestCase
 from tests.fixtures import get_fixture
 from datetime import datetime, timezone
+import gc
+import weakref
 from bpylist.archive_types import uid, timestamp
 from bpylist import archiver, bplist
 
@@ -39,6 +41,12 @@ class UnarchiveTest(TestCase):
         class_map = {'crap.Foo': FooArchive} if with_class_map else None
         return archiver.loads(self.fixture(plist), class_map, opaque)
 
+    def archive_plist(self, objects, root=1):
+        return bplist.dumps({'$archiver': 'NSKeyedArchiver',
+                             '$version': archiver.NSKeyedArchiveVersion,
+                             '$objects': objects,
+                             '$top': {'root': uid(root)}})
+
     def test_complains_about_incorrect_archive_type(self):
         with self.assertRaises(archiver.UnsupportedArchiver):
             self.unarchive('invalid_type')
@@ -48,8 +56,9 @@ class UnarchiveTest(TestCase):
             self.unarchive('invalid_version')
 
     def test_complains_about_missing_top_object(self):
-        with self.assertRaises(archiver.MissingTopObject):
+        with self.assertRaises(archiver.MissingTopObject) as cm:
             self.unarchive('no_top')
+        self.assertIn("'$archiver': 'NSKeyedArchiver'", str(cm.exception))
 
     def test_complains_about_missing_top_object_uid(self):
         with self.assertRaises(archiver.MissingTopObjectUID):
@@ -146,6 +155,135 @@ class UnarchiveTest(TestCase):
         self.assertIsInstance(x1, archiver.Mutable)
         self.assertIs(x1['bar'], x2)
 
+    def test_unpack_deeply_nested_array(self):
+        depth = 1500
+        array_class = {'$classes': ['NSArray', 'NSObject'], '$classname': 'NSArray'}
+        objects = ['$null', array_class]
+        for i in range(depth):
+            children = [uid(len(objects) + 1)] if i < depth - 1 else []
+            objects.append({'$class': uid(1), 'NS.objects': children})
+        obj = archiver.loads(self.archive_plist(objects, root=2))
+        for _ in range(depth - 1):
+            self.assertEqual(len(obj), 1)
+            obj = obj[0]
+        self.assertEqual(obj, [])
+
+    def test_unpack_lazy_dict(self):
+        obj = {'fruit': ['kiwi', 'banana'], 'count': 3, 'date': timestamp(0)}
+        unarch = archiver.Unarchive(archiver.dumps(obj))
+        lazy = unarch.top_object_lazy()
+        self.assertIsInstance(lazy, archiver.LazyArchivedDict)
+        self.assertEqual(set(obj), set(lazy))
+        self.assertIs(unarch.unpacked_uids[1], archiver._UNSET)
+        self.assertEqual(['kiwi', 'banana'], lazy['fruit'])
+        self.assertIs(lazy['fruit'], lazy['fruit'])
+        self.assertEqual(obj, dict(lazy))
+
+    def test_unpack_lazy_opaque(self):
+        unarch = archiver.Unarchive(self.fixture('opaque'))
+        unarch.class_map = archiver.OpaqueClassMap(unarch.class_map)
+        lazy = unarch.top_object_lazy()
+        self.assertEqual({'foo': 'abc', 'bar': 42}, dict(lazy))
+
+    def test_unpack_lazy_array(self):
+        unarch = archiver.Unarchive(archiver.dumps([1, 'two']))
+        self.assertEqual([1, 'two'], unarch.top_object_lazy())
+
+    def test_unpack_ignores_keys_the_delegate_does_not_read(self):
+        class Named:
+            def decode_archive(self, archive):
+                self.name = archive.decode('name')
+
+        foo_class = {'$classes': ['Named', 'NSObject'], '$classname': 'Named'}
+        unmapped_class = {'$classes': ['Unmapped', 'NSObject'], '$classname': 'Unmapped'}
+        objects = ['$null',
+                   {'$class': uid(2), 'name': uid(3), 'extra': uid(4)},
+                   foo_class,
+                   'kiwi',
+                   {'$class': uid(5)},
+                   unmapped_class]
+        foo = archiver.loads(self.archive_plist(objects), {'Named': Named})
+        self.assertEqual('kiwi', foo.name)
+
+    def test_unpack_reads_keys_after_nested_decodes(self):
+        class Named:
+            def decode_archive(self, archive):
+                self.name = archive.decode('name')
+
+        class Pair:
+            def decode_archive(self, archive):
+                self.first = archive.decode('first')
+                self.second = archive.decode('second')
+                self.label = archive.decode('label')
+
+        named_class = {'$classes': ['Named', 'NSObject'], '$classname': 'Named'}
+        pair_class = {'$classes': ['Pair', 'NSObject'], '$classname': 'Pair'}
+        objects = ['$null',
+                   {'$class': uid(2), 'first': uid(3), 'second': uid(8),
+                    'label': uid(5)},
+                   pair_class,
+                   {'$class': uid(4), 'name': uid(6), 'label': uid(7)},
+                   named_class,
+                   'outer',
+                   'kiwi',
+                   'inner',
+                   {'$class': uid(4), 'name': uid(9)},
+                   'banana']
+        pair = archiver.loads(self.archive_plist(objects),
+                              {'Named': Named, 'Pair': Pair})
+        self.assertEqual('kiwi', pair.first.name)
+        self.assertEqual('banana', pair.second.name)
+        self.assertEqual('outer', pair.label)
+
+    def test_unpack_leaves_no_reference_cycles(self):
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            unarch = archiver.Unarchive(archiver.dumps({'fruit': ['kiwi', {'count': 3}]}))
+            unarch.top_object()
+            ref = weakref.ref(unarch)
+            del unarch
+            self.assertIsNone(ref())
+        finally:
+            if enabled:
+                gc.enable()
+
+    def test_unpack_twice(self):
+        data = archiver.dumps({'fruit': ['kiwi', 'banana']})
+        unarch = archiver.Unarchive(data)
+        obj = unarch.top_object()
+        self.assertIs(obj, unarch.top_object())
+        self.assertIs(data, unarch.input)
+
+    def test_unpack_long_arrays(self):
+        self.assertEqual(list(range(20)) + [None], archiver.loads(archiver.dumps(list(range(20)) + [None])))
+        obj = [str(i) for i in range(20)] + [{'count': 3}]
+        self.assertEqual(obj, archiver.loads(archiver.dumps(obj)))
+
+    def test_unpack_array_does_not_compare_members(self):
+        class Incomparable:
+            def decode_archive(self, archive):
+                pass
+
+            def __eq__(self, other):
+                raise AssertionError('compared a member')
+
+            __hash__ = object.__hash__
+
+        array_class = {'$classes': ['NSArray', 'NSObject'], '$classname': 'NSArray'}
+        foo_class = {'$classes': ['Incomparable', 'NSObject'],
+                     '$classname': 'Incomparable'}
+        objects = ['$null',
+                   {'$class': uid(2), 'NS.objects': [uid(3)] * 20},
+                   array_class,
+                   {'$class': uid(4)},
+                   foo_class]
+        arr = archiver.loads(self.archive_plist(objects),
+                             {'Incomparable': Incomparable})
+        self.assertEqual(20, len(arr))
+        self.assertIsInstance(arr[0], Incomparable)
+        self.assertIs(arr[0], arr[19])
+
     def test_index_set(self):
         foo = self.unarchive('index_set', opaque=True)
         self.assertIsInstance(foo, archiver.OpaqueObject)
@@ -217,6 +355,74 @@ class ArchiveTest(TestCase):
         foo_obj = plist['$objects'][1]
         self.assertEqual(uid(1), foo_obj['recurse'])
 
+    def test_timestamp_array(self):
+        shared = timestamp(9001)
+        stamps = [timestamp(-4), shared, timestamp(1_500_000_000.25), shared]
+        self.archive(stamps)
+        plist = bplist.loads(archiver.dumps(stamps))
+        refs = plist['$objects'][1]['NS.objects']
+        self.assertEqual(refs[1], refs[3])
+        # same archive as when every timestamp goes through encode_archive
+        class PlainArchive(archiver.Archive):
+            def encode_list(self, objs, archive_obj):
+                archive_obj['$class'] = self.uid_for_class_chain(('NSArray', 'NSObject'))
+                archive_obj['NS.objects'] = [self.archive(obj) for obj in objs]
+
+        self.assertEqual(PlainArchive(stamps).to_bytes(), archiver.dumps(stamps))
+
+    def test_encoder_override(self):
+        class UpperArchive(archiver.Archive):
+            def encode_list(self, objs, archive_obj):
+                super().encode_list([o.upper() for o in objs], archive_obj)
+
+        self.assertEqual(['A', 'B'], archiver.loads(UpperArchive(['a', 'b']).to_bytes()))
+
+    def test_archive_leaves_no_reference_cycles(self):
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            arch = archiver.Archive({'fruit': ['kiwi', 'banana']})
+            arch.to_bytes()
+            ref = weakref.ref(arch)
+            del arch
+            self.assertIsNone(ref())
+        finally:
+            if enabled:
+                gc.enable()
+
+    def test_class_map_changes_apply(self):
+        class_map = archiver.DefaultClassMap()
+        self.assertEqual(['NSDictionary', 'NSObject'], class_map.get_objc_class(dict))
+        class_map.archive_class_map[dict] = 'NSMutableDictionary'
+        self.assertEqual(['NSMutableDictionary', 'NSDictionary', 'NSObject'],
+                         class_map.get_objc_class(dict))
+
+    def test_to_bytes_is_reused(self):
+        arch = archiver.Archive({'fruit': ['kiwi', 'banana']})
+        data = arch.to_bytes()
+        self.assertIs(data, arch.to_bytes())
+        self.assertEqual({'fruit': ['kiwi', 'banana']}, archiver.loads(data))
+
+    def test_assume_tree(self):
+        obj = {'fruit': ['kiwi', 'banana'], 'count': 3, 'date': timestamp(0)}
+        archived = archiver.dumps(obj, assume_tree=True)
+        self.assertEqual(obj, archiver.loads(archived))
+
+    def test_assume_tree_circular_ref(self):
+        obj = []
+        obj.append(obj)
+        with self.assertRaises(archiver.CircularReference):
+            archiver.dumps(obj, assume_tree=True)
+
+    def test_opaque_class_hierarchy(self):
+        class_map = archiver.OpaqueClassMap(archiver.ClassMap())
+        index_set = class_map.get_python_class(['NSMutableIndexSet', 'NSIndexSet', 'NSObject'])
+        index_path = class_map.get_python_class(['NSIndexPath', 'NSObject'])
+        self.assertIs(index_set, class_map.get_python_class(['NSMutableIndexSet', 'NSIndexSet', 'NSObject']))
+        self.assertIs(index_set.__bases__[0].__bases__[0], index_path.__bases__[0])
+        self.assertEqual(['NSMutableIndexSet', 'NSIndexSet', 'NSObject'],
+                         class_map.get_objc_class(index_set))
+
     def test_opaque(self):
         klass = archiver.OpaqueClassMap(archiver.ClassMap()).get_python_class(['XXCustomObject', 'NSObject'])
         foo = klass()
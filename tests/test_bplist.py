@@ -300,6 +300,10 @@ class TestBPlistArchiverSupport(BPListTest):
         self.generate_and_parse(uid(65_535))
         self.generate_and_parse(uid(4_000_000_000))
 
+    def test_long_uid_array(self):
+        uids = [uid(i) for i in range(10_000)]
+        self.assertEqual(uids, bplist.loads(bplist.dumps(uids)))
+
     def test_parse_unknown(self):
         with self.assertRaisesRegex(TypeError, "expected bytes, module found"):
             bplist.loads(bplist)
@@ -308,6 +312,38 @@ class TestBPlistArchiverSupport(BPListTest):
         with self.assertRaisesRegex(RuntimeError, "does not support"):
             bplist.dumps(bplist)
 
+
+class TestBPlistReader(BPListTest):
+
+    def test_top_object(self):
+        data = self.fixture('dict_nested')
+        reader = bplist.open(data)
+        self.assertEqual(bplist.loads(data), reader[reader.top])
+
+    def test_dict_maps_keys_to_indexes(self):
+        obj = {'foo': 42, 'bar': [1, 'two']}
+        reader = bplist.open(bplist.dumps(obj))
+        shallow = reader.dict(reader.top)
+        self.assertEqual({'foo', 'bar'}, set(shallow))
+        self.assertEqual(42, reader[shallow['foo']])
+        self.assertEqual([1, 'two'], reader[shallow['bar']])
+        self.assertIsNone(reader.dict(shallow['foo']))
+
+    def test_array_view(self):
+        obj = {'items': [True, 'two', 3.0, {'four': 4}]}
+        reader = bplist.open(memoryview(bplist.dumps(obj)))
+        items = reader.array(reader.dict(reader.top)['items'])
+        self.assertEqual(4, len(items))
+        self.assertEqual(obj['items'], list(items))
+        self.assertEqual(4, items[uid(3)]['four'])
+        self.assertIsNone(items.array(0))
+        with self.assertRaises(IndexError):
+            items[4]
+
+    def test_open_invalid(self):
+        with self.assertRaisesRegex(RuntimeError, "invalid header"):
+            bplist.open(b'not a plist')
+
 if __name__ == '__main__':
     from unittest import main
     main()